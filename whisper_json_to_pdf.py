@@ -14,10 +14,14 @@ Usage:
 from __future__ import annotations
 
 import argparse
+import hashlib
 import json
-import math
+import os
 import re
+from bisect import bisect_left, bisect_right
+from concurrent.futures import ProcessPoolExecutor
 from dataclasses import dataclass
+from itertools import accumulate
 from typing import List, Optional, Tuple
 
 from reportlab.lib.pagesizes import letter
@@ -28,12 +32,21 @@ from reportlab.platypus import (
     SimpleDocTemplate,
     Paragraph,
     Spacer,
-    Table,
+    LongTable,
     TableStyle,
     PageBreak,
 )
 from reportlab.lib import colors
 
+try:
+    import ijson  # optional: streaming JSON parser for long transcripts
+except ImportError:
+    ijson = None
+else:
+    # Only the C backends keep up with json.load; the pure-Python one is ~20x slower.
+    if ijson.backend not in ("yajl2_c", "yajl2_cffi"):
+        ijson = None
+
 
 # ----------------------------
 # Helpers: time + text cleanup
@@ -49,6 +62,10 @@ def fmt_time(seconds: float) -> str:
     return f"{m:02d}:{sec:02d}"
 
 
+# Bump whenever build_blocks output changes -- cleanup rules, filler list *or*
+# binning. It is part of the --cache key; forgetting it serves stale blocks silently.
+CLEANUP_VERSION = 3
+
 FILLER_WORDS = [
     r"\bum+\b",
     r"\buh+\b",
@@ -61,12 +78,34 @@ FILLER_WORDS = [
     r"\bI mean\b",
 ]
 
+# Shared alternation source for the filler patterns below.
+_FILLER_ALT = "|".join(FILLER_WORDS)
+
 FILLER_RE = re.compile(
     r"(?i)(?:"
-    + "|".join(FILLER_WORDS)
+    + _FILLER_ALT
     + r")"
 )
 
+# Standalone filler word/phrase. A preceding space is consumed with it (so removal never
+# leaves "  " behind); a preceding ,;: and the following separator are only checked, so
+# the space after them, e.g. "a,uh 3" -> "a, 3", survives.
+# Stays on stdlib re: each alternative is a literal bounded by separator classes, so
+# there is no catastrophic backtracking, and google-re2's sub() was ~3x slower here
+# because of its per-match Python overhead.
+FILLER_BOUNDED_RE = re.compile(
+    r"(?i)(?:^|(?<=[,;:])| )(?:"
+    + _FILLER_ALT
+    + r")(?=[ ,;:]|$)"
+)
+
+_WS_RE = re.compile(r"\s+")
+_DEDUP_RE = re.compile(r"(?i)\b(\w+)\s+\1\b")
+_PUNCT_SPACE_BEFORE_RE = re.compile(r"\s+([,.;:!?])")
+_PUNCT_SPACE_AFTER_RE = re.compile(r"([,.;:!?])([A-Za-z])")
+_DBL_PUNCT_RE = re.compile(r"([,.;:!?])\1+")
+_TERM_RE = re.compile(r"[.!?]\s*$")
+
 def light_cleanup(text: str) -> str:
     """
     Conservative cleanup:
@@ -79,27 +118,26 @@ def light_cleanup(text: str) -> str:
     t = text.strip()
 
     # Normalize whitespace
-    t = re.sub(r"\s+", " ", t)
+    t = _WS_RE.sub(" ", t)
 
     # Remove filler (only when it appears as a standalone phrase/word)
-    # Keep it conservative by removing with surrounding optional commas/spaces.
-    t = re.sub(r"(?i)(^|[ ,;:])(" + "|".join(FILLER_WORDS) + r")([ ,;:]|$)", r"\1\3", t)
-    t = re.sub(r"\s+", " ", t).strip()
+    # Keep it conservative: surrounding commas stay, and no second whitespace pass is needed.
+    t = FILLER_BOUNDED_RE.sub("", t).strip()
 
     # De-stutter: repeated words (case-insensitive), e.g. "the the", "we we"
-    t = re.sub(r"(?i)\b(\w+)\s+\1\b", r"\1", t)
+    t = _DEDUP_RE.sub(r"\1", t)
 
     # Fix spacing before punctuation
-    t = re.sub(r"\s+([,.;:!?])", r"\1", t)
+    t = _PUNCT_SPACE_BEFORE_RE.sub(r"\1", t)
 
     # Ensure space after punctuation when followed by a letter
-    t = re.sub(r"([,.;:!?])([A-Za-z])", r"\1 \2", t)
+    t = _PUNCT_SPACE_AFTER_RE.sub(r"\1 \2", t)
 
     # Clean double punctuation like ".." or ",,"
-    t = re.sub(r"([,.;:!?])\1+", r"\1", t)
+    t = _DBL_PUNCT_RE.sub(r"\1", t)
 
     # If it looks like a sentence chunk and lacks terminal punctuation, add a period.
-    if t and not re.search(r"[.!?]\s*$", t):
+    if t and not _TERM_RE.search(t):
         # Avoid adding periods after headings or short fragments
         if len(t) > 40:
             t += "."
@@ -113,6 +151,8 @@ def light_cleanup(text: str) -> str:
 
 @dataclass
 class Segment:
+    __slots__ = ("start", "end", "text")
+
     start: float
     end: float
     text: str
@@ -120,67 +160,158 @@ class Segment:
 
 @dataclass
 class Block:
+    __slots__ = ("start", "end", "text")
+
     start: float
     end: float
     text: str
 
 
+def _segment_from_json(s: dict) -> Segment:
+    return Segment(
+        start=float(s.get("start", 0.0)),
+        end=float(s.get("end", 0.0)),
+        text=str(s.get("text", "")).strip(),
+    )
+
+
 def load_whisper_json(path: str) -> List[Segment]:
+    if ijson is not None:
+        # Stream segments one at a time; tokens/logprobs are never materialized.
+        # Saves memory, not time: a C-backed ijson parses about as fast as json.load.
+        try:
+            with open(path, "rb") as f:
+                segs = [_segment_from_json(s) for s in ijson.items(f, "segments.item")]
+        except ijson.JSONError:
+            segs = []  # malformed JSON: let json.load raise its usual ValueError
+        if segs:
+            return segs
+        # Nothing streamed: fall through so a missing/empty list (or bad JSON) gets the usual check.
+
     with open(path, "r", encoding="utf-8") as f:
         data = json.load(f)
 
     if "segments" not in data or not isinstance(data["segments"], list):
         raise ValueError("JSON does not look like Whisper output: missing 'segments' list.")
 
-    segs: List[Segment] = []
-    for s in data["segments"]:
-        segs.append(Segment(
-            start=float(s.get("start", 0.0)),
-            end=float(s.get("end", 0.0)),
-            text=str(s.get("text", "")).strip(),
-        ))
-    return segs
+    return [_segment_from_json(s) for s in data["segments"]]
 
 
-def build_blocks(segments: List[Segment], interval_s: int = 30) -> List[Block]:
+def build_blocks(segments: List[Segment], interval_s: int = 30, jobs: int = 1) -> List[Block]:
     """
     Group Whisper segments into ~interval_s blocks by time.
     Each block becomes one "margin timestamp" row in the PDF.
+    With jobs > 1 the per-block cleanup runs in that many worker processes.
     """
     if not segments:
         return []
 
-    # Determine transcript start/end
+    # Sorted search keys for the bin edges. Running maxima keep them sorted
+    # even if a segment is out of order; for ordered input they are the raw times.
+    starts = list(accumulate((s.start for s in segments), max))
+    ends = list(accumulate((s.end for s in segments), max))
+
+    # Determine transcript start/end (the last running maximum is the latest end)
     t_start = segments[0].start
-    t_end = max(s.end for s in segments)
+    t_end = ends[-1]
 
     # Align bins to the floor of the first segment start
-    bin0 = math.floor(t_start / interval_s) * interval_s
-    nbins = int(math.ceil((t_end - bin0) / interval_s))
+    # (floor division on the float times; -(-x // n) is ceil(x / n))
+    bin0 = int(t_start // interval_s) * interval_s
+    nbins = int(-((bin0 - t_end) // interval_s))
 
-    blocks: List[Block] = []
-    seg_idx = 0
+    # (b_start, b_end, joined segment text) for every non-empty bin
+    pending: List[Tuple[int, int, str]] = []
 
     for i in range(nbins):
         b_start = bin0 + i * interval_s
         b_end = b_start + interval_s
 
-        texts = []
-        # collect segments overlapping this bin
-        while seg_idx < len(segments) and segments[seg_idx].end <= b_start:
-            seg_idx += 1
+        # collect segments overlapping this bin: skip those ending before
+        # b_start, stop at those starting at or after b_end
+        lo = bisect_right(ends, b_start)
+        hi = bisect_left(starts, b_end)
 
-        j = seg_idx
-        while j < len(segments) and segments[j].start < b_end:
-            if segments[j].text:
-                texts.append(segments[j].text)
-            j += 1
+        texts = [s.text for s in segments[lo:hi] if s.text]
 
         if texts:
-            raw = " ".join(texts)
-            cleaned = light_cleanup(raw)
-            if cleaned:
-                blocks.append(Block(start=b_start, end=b_end, text=cleaned))
+            pending.append((b_start, b_end, " ".join(texts)))
+
+    raws = [raw for _, _, raw in pending]
+    if jobs > 1:
+        # Bins are independent, so cleanup parallelizes trivially; process
+        # start-up costs more than all of build_blocks on a typical lecture.
+        with ProcessPoolExecutor(max_workers=jobs) as ex:
+            cleaned = list(ex.map(light_cleanup, raws, chunksize=16))
+    else:
+        cleaned = [light_cleanup(raw) for raw in raws]
+
+    blocks: List[Block] = [
+        Block(start=b_start, end=b_end, text=text)
+        for (b_start, b_end, _), text in zip(pending, cleaned)
+        if text
+    ]
+
+    return blocks
+
+
+# Oldest entries beyond this many are deleted after each cache write.
+_CACHE_MAX_ENTRIES = 32
+
+
+def _blocks_cache_path(json_path: str, interval_s: int) -> str:
+    h = hashlib.sha256()
+    with open(json_path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    h.update(f"|{interval_s}|{CLEANUP_VERSION}".encode())
+
+    cache_home = os.environ.get("XDG_CACHE_HOME") or os.path.expanduser("~/.cache")
+    return os.path.join(cache_home, "lecture_cleaner", h.hexdigest() + ".json")
+
+
+def _prune_blocks_cache(cache_dir: str) -> None:
+    entries = [e for e in os.scandir(cache_dir) if e.name.endswith(".json")]
+    entries.sort(key=lambda e: e.stat().st_mtime, reverse=True)
+    for e in entries[_CACHE_MAX_ENTRIES:]:
+        os.remove(e.path)
+
+
+def load_blocks_cached(json_path: str, interval_s: int = 30, jobs: int = 1) -> List[Block]:
+    """
+    load_whisper_json + build_blocks, cached on disk by JSON content, interval
+    and CLEANUP_VERSION. Re-runs that only change --title/--subtitle skip
+    parsing and cleanup entirely. Only the most recently used entries are kept.
+    """
+    cache_path = _blocks_cache_path(json_path, interval_s)
+    try:
+        with open(cache_path, "r", encoding="utf-8") as f:
+            blocks = [Block(start, end, text) for start, end, text in json.load(f)]
+    except (OSError, ValueError, TypeError):
+        pass  # missing or unreadable entry: rebuild it
+    else:
+        try:
+            os.utime(cache_path)  # mark as recently used for pruning
+        except OSError:
+            pass  # e.g. read-only cache dir; the hit is still good
+        return blocks
+
+    blocks = build_blocks(load_whisper_json(json_path), interval_s=interval_s, jobs=jobs)
+
+    tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+    try:
+        os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump([(b.start, b.end, b.text) for b in blocks], f)
+        os.replace(tmp_path, cache_path)
+        _prune_blocks_cache(os.path.dirname(cache_path))
+    except OSError:
+        pass  # caching is best-effort
+    finally:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass  # already renamed into place, or never created
 
     return blocks
 
@@ -189,12 +320,51 @@ def build_blocks(segments: List[Segment], interval_s: int = 30) -> List[Block]:
 # PDF generation (margin timestamps)
 # ----------------------------
 
+# Built once at import and shared by every make_pdf call.
+_STYLES = getSampleStyleSheet()
+STYLE_TITLE = ParagraphStyle(
+    "Title",
+    parent=_STYLES["Title"],
+    fontName="Helvetica-Bold",
+    fontSize=18,
+    leading=22,
+    spaceAfter=10,
+    alignment=TA_LEFT,
+)
+STYLE_SUBTITLE = ParagraphStyle(
+    "Subtitle",
+    parent=_STYLES["Normal"],
+    fontName="Helvetica",
+    fontSize=10.5,
+    leading=14,
+    textColor=colors.grey,
+    spaceAfter=18,
+)
+STYLE_TS = ParagraphStyle(
+    "Timestamp",
+    parent=_STYLES["Normal"],
+    fontName="Helvetica",
+    fontSize=9,
+    leading=12,
+    textColor=colors.grey,
+)
+STYLE_BODY = ParagraphStyle(
+    "Body",
+    parent=_STYLES["Normal"],
+    fontName="Helvetica",
+    fontSize=11,
+    leading=15,
+    spaceAfter=6,
+)
+
+
 def make_pdf(
     blocks: List[Block],
     out_pdf: str,
     title: str,
     subtitle: Optional[str] = None,
     pagesize=letter,
+    inline_timestamps: bool = False,
 ) -> None:
     doc = SimpleDocTemplate(
         out_pdf,
@@ -207,75 +377,52 @@ def make_pdf(
         author="Whisper Transcript Formatter",
     )
 
-    styles = getSampleStyleSheet()
-    style_title = ParagraphStyle(
-        "Title",
-        parent=styles["Title"],
-        fontName="Helvetica-Bold",
-        fontSize=18,
-        leading=22,
-        spaceAfter=10,
-        alignment=TA_LEFT,
-    )
-    style_subtitle = ParagraphStyle(
-        "Subtitle",
-        parent=styles["Normal"],
-        fontName="Helvetica",
-        fontSize=10.5,
-        leading=14,
-        textColor=colors.grey,
-        spaceAfter=18,
-    )
-    style_ts = ParagraphStyle(
-        "Timestamp",
-        parent=styles["Normal"],
-        fontName="Helvetica",
-        fontSize=9,
-        leading=12,
-        textColor=colors.grey,
-    )
-    style_body = ParagraphStyle(
-        "Body",
-        parent=styles["Normal"],
-        fontName="Helvetica",
-        fontSize=11,
-        leading=15,
-        spaceAfter=6,
-    )
-
     story = []
-    story.append(Paragraph(title, style_title))
+    story.append(Paragraph(title, STYLE_TITLE))
     if subtitle:
-        story.append(Paragraph(subtitle, style_subtitle))
-
-    # Table approach: two columns per block:
-    # left = timestamp, right = text
-    rows = []
-    for b in blocks:
-        ts = fmt_time(b.start)
-        rows.append([
-            Paragraph(f"<b>{ts}</b>", style_ts),
-            Paragraph(b.text, style_body),
-        ])
-
-    # Column widths: timestamp margin + main text
-    # Adjust if you want a wider margin
-    table = Table(
-        rows,
-        colWidths=[0.9 * inch, doc.width - 0.9 * inch],
-        hAlign="LEFT",
-    )
-    table.setStyle(TableStyle([
-        ("VALIGN", (0, 0), (-1, -1), "TOP"),
-        ("LEFTPADDING", (0, 0), (-1, -1), 0),
-        ("RIGHTPADDING", (0, 0), (-1, -1), 0),
-        ("TOPPADDING", (0, 0), (-1, -1), 1),
-        ("BOTTOMPADDING", (0, 0), (-1, -1), 5),
-        # subtle row separators (optional)
-        ("LINEBELOW", (0, 0), (-1, -1), 0.25, colors.whitesmoke),
-    ]))
-
-    story.append(table)
+        story.append(Paragraph(subtitle, STYLE_SUBTITLE))
+
+    timestamps = [fmt_time(b.start) for b in blocks]
+
+    if inline_timestamps:
+        # Single column: one Paragraph per block with the timestamp as a grey
+        # prefix. Half the flowables of the table layout, so faster to build.
+        for ts, b in zip(timestamps, blocks):
+            story.append(Paragraph(
+                f'<font color="grey" size="9"><b>{ts}</b></font>&nbsp;&nbsp;{b.text}',
+                STYLE_BODY,
+            ))
+    else:
+        # Table approach: two columns per block:
+        # left = timestamp, right = text
+        rows = []
+        for ts, b in zip(timestamps, blocks):
+            rows.append([
+                Paragraph(f"<b>{ts}</b>", STYLE_TS),
+                Paragraph(b.text, STYLE_BODY),
+            ])
+
+        # Column widths: timestamp margin + main text
+        # Adjust if you want a wider margin
+        # LongTable lays out and splits row by row, so long lectures don't
+        # keep a full-table layout pass in memory.
+        table = LongTable(
+            rows,
+            colWidths=[0.9 * inch, doc.width - 0.9 * inch],
+            hAlign="LEFT",
+        )
+        table.setStyle(TableStyle([
+            ("VALIGN", (0, 0), (-1, -1), "TOP"),
+            ("LEFTPADDING", (0, 0), (-1, -1), 0),
+            ("RIGHTPADDING", (0, 0), (-1, -1), 0),
+            ("TOPPADDING", (0, 0), (-1, -1), 1),
+            ("BOTTOMPADDING", (0, 0), (-1, -1), 5),
+            # subtle row separators (optional)
+            ("LINEBELOW", (0, 0), (-1, -1), 0.25, colors.whitesmoke),
+        ]))
+
+        story.append(table)
+
     doc.build(story)
 
 
@@ -286,16 +433,33 @@ def main():
     ap.add_argument("--title", default="Lecture Transcript", help="PDF title")
     ap.add_argument("--subtitle", default=None, help="Optional subtitle (course/date/etc.)")
     ap.add_argument("--interval", type=int, default=30, help="Timestamp interval in seconds (default 30)")
+    ap.add_argument("--inline-timestamps", action="store_true",
+                    help="Put timestamps inline before each block instead of in a margin column (faster for long lectures)")
+    ap.add_argument("--jobs", type=int, default=1,
+                    help="Worker processes for per-block text cleanup (default 1; may help on multi-core machines)")
+    ap.add_argument("--cache", action="store_true",
+                    help="Reuse cleaned blocks from ~/.cache/lecture_cleaner (handy when re-running with a new --title)")
 
     args = ap.parse_args()
+    if args.jobs < 1:
+        ap.error("--jobs must be at least 1")
 
-    segments = load_whisper_json(args.whisper_json)
-    blocks = build_blocks(segments, interval_s=args.interval)
+    if args.cache:
+        blocks = load_blocks_cached(args.whisper_json, interval_s=args.interval, jobs=args.jobs)
+    else:
+        segments = load_whisper_json(args.whisper_json)
+        blocks = build_blocks(segments, interval_s=args.interval, jobs=args.jobs)
 
     if not blocks:
         raise SystemExit("No transcript text found in JSON segments.")
 
-    make_pdf(blocks, out_pdf=args.out, title=args.title, subtitle=args.subtitle)
+    make_pdf(
+        blocks,
+        out_pdf=args.out,
+        title=args.title,
+        subtitle=args.subtitle,
+        inline_timestamps=args.inline_timestamps,
+    )
     print(f"Wrote: {args.out}  ({len(blocks)} timestamp blocks, ~{args.interval}s each)")
 
 